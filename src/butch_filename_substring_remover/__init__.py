@@ -1,4 +1,4 @@
 
 from .rename import rename_files_and_dirs
-from .utils import remove_substrings
+from .utils import remove_substrings, make_remover
 from .rename_directory import rename_directory
\ No newline at end of file
@@ -1,69 +1,200 @@
 
 import os
 import sys
-from .utils import remove_substrings, color_text
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+from .utils import make_remover, is_valid_filename, color_text
 
-def rename_files_and_dirs(root_dir: str, to_remove: set[str]) -> None:
-    """Renames files and folders in the specified directory.
-    root_dir: The root directory to rename files and folders in.
-    to_remove: A set of substrings to remove from the names of files and folders."""
+PROGRESS_INTERVAL = 0.05  # Minimum number of seconds between progress line updates
+_RENAME_DIR_FD = os.rename in os.supports_dir_fd  # Whether renameat(2) can be used
+_SUMMARY_HEADER = color_text('Summary:', '1;4;34')
+_CHECK_ERRORS = color_text('Please check the errors above.', '31')
+
+class Operation(NamedTuple):
+    """A single planned rename inside the directory it is grouped under."""
+    old_name: str  # The current name of the item
+    new_name: str  # The name the item is renamed to
+    is_dir: bool  # Whether the item is a directory, as seen during the scan
+
+def _walk_bottom_up(root_dir: str, onerror=None):
+    """Walks the directory tree with os.scandir, yielding every directory after all of its subdirectories.
+    root_dir: The root directory to walk.
+    onerror: An optional function called with the OSError raised when a directory cannot be read.
+    Yields (dirpath, depth, dirnames, filenames) tuples in the same order as os.walk(root_dir, topdown=False),
+    where depth is 0 for root_dir itself."""
+    stack = [(root_dir, 0, None)]  # (dirpath, depth, None) until scanned, then (dirpath, depth, (dirnames, filenames))
+    while stack:
+        dirpath, depth, listing = stack.pop()
+        if listing is not None:
+            yield dirpath, depth, listing[0], listing[1]
+            continue
+        dirnames = []
+        filenames = []
+        try:
+            with os.scandir(dirpath) as it:
+                for entry in it:
+                    # The entry type comes from readdir, so no extra stat call is needed
+                    if entry.is_dir(follow_symlinks=False):
+                        dirnames.append(entry.name)
+                    else:
+                        filenames.append(entry.name)
+        except OSError as e:
+            if onerror is not None:
+                onerror(e)
+            continue
+        stack.append((dirpath, depth, (dirnames, filenames)))
+        for dirname in reversed(dirnames):
+            stack.append((os.path.join(dirpath, dirname), depth + 1, None))
+
+def collect_rename_operations(root_dir: str, remove: Callable[[str], str], all_errors: list[str]) -> tuple[list[dict[str, list[Operation]]], int, int]:
+    """Collects the renames needed in the specified directory without touching the filesystem.
+    root_dir: The root directory to collect renames in.
+    remove: The function that returns the new name for a file or folder name.
+    all_errors: The list that errors found while collecting are appended to.
+    Returns the operations grouped by the directory that contains them, with the groups of each depth below root_dir
+    in the list item of that index, followed by the number of directories and files seen. Each directory path is stored
+    once for its whole group."""
     max_length = 80  # To store the maximum length of the string
-    all_errors = []  # To store all errors that occur during renaming
-    dir_count = 0  # To store the number of directories processed
-    file_count = 0  # To store the number of files processed
+    waves = []  # To store the renames of each directory, bucketed by depth, in the order they have to be performed
     all_dirs = 0  # To store the number of directories
     all_files = 0  # To store the number of files
-    for dirpath, dirnames, filenames in os.walk(root_dir):
-        line = f'Processing: {dirpath}'
-        current_length = len(line)
-        max_length = max(max_length, current_length)  # Update the maximum length of the string
-        print(f'\r{line}{" " * (max_length - current_length)}', end='\n')
+    last_update = -PROGRESS_INTERVAL  # To store when the progress line was last written
 
-        # Renaming files
+    def on_walk_error(e: OSError) -> None:
+        print(f"\nError reading directory '{e.filename}': {e}", file=sys.stderr)
+        all_errors.append(f"\nError reading directory '{e.filename}': {e}")
+
+    # Subdirectories are visited before their parents, so renaming a directory never invalidates a path still to be processed
+    for dirpath, depth, dirnames, filenames in _walk_bottom_up(root_dir, on_walk_error):
+        now = time.monotonic()
+        if now - last_update >= PROGRESS_INTERVAL:  # Rewriting the line for every directory would dominate the scan
+            last_update = now
+            line = f'Processing: {dirpath}'
+            current_length = len(line)
+            max_length = max(max_length, current_length)  # Update the maximum length of the string
+            sys.stdout.write(f'\r{line}{" " * (max_length - current_length)}')
+            sys.stdout.flush()
+        existing_items = set(filenames)  # To store the names already taken in this directory
+        existing_items.update(dirnames)
+        group = []  # To store the renames in this directory
+
+        # Files
         for filename in filenames:
             all_files += 1
-            new_name = remove_substrings(filename, to_remove)
+            new_name = remove(filename)
             if new_name != filename:
-                if new_name == "":
-                    print(f"\nError renaming file '{filename}' to '{new_name}': Empty filename", file=sys.stderr)
-                    all_errors.append(f"\nError renaming file '{filename}' to '{new_name}': Empty filename")
+                if not is_valid_filename(new_name):
+                    print(f"\nError renaming file '{filename}' to '{new_name}': Invalid filename", file=sys.stderr)
+                    all_errors.append(f"\nError renaming file '{filename}' to '{new_name}': Invalid filename")
+                    continue
+                if new_name in existing_items:
+                    print(f"\nError renaming file '{filename}' to '{new_name}': Name already exists", file=sys.stderr)
+                    all_errors.append(f"\nError renaming file '{filename}' to '{new_name}': Name already exists")
                     continue
-                try:
-                    os.rename(os.path.join(dirpath, filename), os.path.join(dirpath, new_name))
-                    file_count += 1
-                except OSError as e:
-                    print(f"\nError renaming file '{filename}' to '{new_name}': {e}", file=sys.stderr)
-                    all_errors.append(f"\nError renaming file '{filename}' to '{new_name}': {e}")
-                except Exception as e:
-                    print(f"Error type: {type(e)}")
-                    print(f"\nError renaming file '{filename}' to '{new_name}': {e}", file=sys.stderr)
-                    all_errors.append(f"\nError renaming file '{filename}' to '{new_name}': {e}")
+                group.append(Operation(filename, new_name, False))
+                # Later entries of this directory must see the name as taken, or two renames to the same name would overwrite each other
+                existing_items.discard(filename)
+                existing_items.add(new_name)
 
-        # Renaming directories
+        # Directories
         for dirname in dirnames:
             all_dirs += 1
-            new_name = remove_substrings(dirname, to_remove)
+            new_name = remove(dirname)
             if new_name != dirname:
-                if new_name == "":
-                    print(f"\nError renaming directory '{dirname}' to '{new_name}': Empty directory name", file=sys.stderr)
-                    all_errors.append(f"\nError renaming directory '{dirname}' to '{new_name}': Empty directory name")
+                if not is_valid_filename(new_name):
+                    print(f"\nError renaming directory '{dirname}' to '{new_name}': Invalid directory name", file=sys.stderr)
+                    all_errors.append(f"\nError renaming directory '{dirname}' to '{new_name}': Invalid directory name")
                     continue
-                try:
-                    os.rename(os.path.join(dirpath, dirname), os.path.join(dirpath, new_name))
-                    dir_count += 1
-                except OSError as e:
-                    print(f"\nError renaming directory '{dirname}' to '{new_name}': {e}", file=sys.stderr)
-                    all_errors.append(f"\nError renaming directory '{dirname}' to '{new_name}': {e}")
-                except Exception as e:
-                    print(f"Error type: {type(e)}")
-                    print(f"\nError renaming directory '{dirname}' to '{new_name}': {e}", file=sys.stderr)
-                    all_errors.append(f"\nError renaming directory '{dirname}' to '{new_name}': {e}")
-    for error in all_errors:
-        print(color_text(error, "31"), file=sys.stderr)
+                if new_name in existing_items:
+                    print(f"\nError renaming directory '{dirname}' to '{new_name}': Name already exists", file=sys.stderr)
+                    all_errors.append(f"\nError renaming directory '{dirname}' to '{new_name}': Name already exists")
+                    continue
+                group.append(Operation(dirname, new_name, True))
+                # Later entries of this directory must see the name as taken, or two renames to the same name would overwrite each other
+                existing_items.discard(dirname)
+                existing_items.add(new_name)
+        if group:
+            while len(waves) <= depth:
+                waves.append({})
+            waves[depth][dirpath] = group
+    print()  # Finish the progress line
+    return waves, all_dirs, all_files
+
+def _rename_group(dirpath: str, group: list[Operation]) -> list[tuple[Operation, Exception | None]]:
+    """Performs the renames of a single directory in order.
+    dirpath: The directory that contains every item in the group.
+    group: The operations of that directory, as returned by collect_rename_operations.
+    Returns each operation paired with the exception it raised, or None if it succeeded."""
+    dir_fd = None  # To store the descriptor the names are renamed relative to, if renameat is available
+    if _RENAME_DIR_FD:
+        try:
+            dir_fd = os.open(dirpath, os.O_RDONLY | os.O_DIRECTORY)
+        except OSError:
+            pass  # Fall back to full paths, so the rename itself reports the problem
+    results = []
+    try:
+        for operation in group:
+            try:
+                if dir_fd is None:
+                    os.rename(os.path.join(dirpath, operation.old_name), os.path.join(dirpath, operation.new_name))
+                else:
+                    # Only the last path component has to be resolved by the kernel
+                    os.rename(operation.old_name, operation.new_name, src_dir_fd=dir_fd, dst_dir_fd=dir_fd)
+            except Exception as e:
+                results.append((operation, e))
+            else:
+                results.append((operation, None))
+    finally:
+        if dir_fd is not None:
+            os.close(dir_fd)
+    return results
+
+def rename_files_and_dirs(root_dir: str, to_remove: set[str] | frozenset[str]) -> None:
+    """Renames files and folders in the specified directory.
+    root_dir: The root directory to rename files and folders in.
+    to_remove: A set of substrings to remove from the names of files and folders."""
+    _rename_with_remover(root_dir, make_remover(frozenset(to_remove)))
+
+def _rename_with_remover(root_dir: str, remove: Callable[[str], str]) -> None:
+    """Renames files and folders in the specified directory with an already built remover.
+    root_dir: The root directory to rename files and folders in.
+    remove: The function that returns the new name for a file or folder name, as built by make_remover."""
+    all_errors = []  # To store all errors that occur during renaming
+    dir_count = 0  # To store the number of directories processed
+    file_count = 0  # To store the number of files processed
+    waves, all_dirs, all_files = collect_rename_operations(root_dir, remove, all_errors)
+
+    # Renames in different directories at the same depth are independent, so each depth is run as one concurrent wave,
+    # deepest first, while the renames inside a single directory stay in order
+    with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as executor:
+        for wave in reversed(waves):
+            futures = [executor.submit(_rename_group, dirpath, group) for dirpath, group in wave.items()]
+            for future in futures:
+                for (old_name, new_name, is_dir), error in future.result():
+                    # The entry type was recorded while scanning, so no stat call is needed here
+                    item_type = "directory" if is_dir else "file"
+                    if error is None:
+                        if is_dir:
+                            dir_count += 1
+                        else:
+                            file_count += 1
+                        continue
+                    if not isinstance(error, OSError):
+                        print(f"Error type: {type(error)}")
+                    print(f"\nError renaming {item_type} '{old_name}' to '{new_name}': {error}", file=sys.stderr)
+                    all_errors.append(f"\nError renaming {item_type} '{old_name}' to '{new_name}': {error}")
+    sys.stderr.write("".join(f"{color_text(error, '31', to_stderr=True)}\n" for error in all_errors))
 
-    print(f"\n{color_text('Summary:', '1;4;34')}")
-    print(f"Directories renamed: {color_text(dir_count, '32')}/{all_dirs}")
-    print(f"Files renamed: {color_text(file_count, '32')}/{all_files}")
-    print(f"Errors: {color_text(len(all_errors), '31')}")
+    # The summary is written in one call instead of one print per line
+    summary = [
+        f"\n{_SUMMARY_HEADER}\n",
+        f"Directories renamed: {color_text(dir_count, '32')}/{all_dirs}\n",
+        f"Files renamed: {color_text(file_count, '32')}/{all_files}\n",
+        f"Errors: {color_text(len(all_errors), '31')}\n",
+    ]
     if all_errors:
-        print(color_text("Please check the errors above.", "31"))
\ No newline at end of file
+        summary.append(f"{_CHECK_ERRORS}\n")
+    sys.stdout.write("".join(summary))
+    sys.stdout.flush()
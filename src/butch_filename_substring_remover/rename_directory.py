@@ -1,10 +1,38 @@
 
 import os
-from .rename import rename_files_and_dirs
+import stat
+from .rename import _rename_with_remover
+from .utils import make_remover
 
-def rename_directory(root_directory: str, substrings_to_remove: list) -> None:
-    # Check if the directory exists
-    if not os.path.isdir(root_directory):
+# Directories in which it is not safe to run the script
+_UNIX_SYS_DIRS = ("/", "/bin", "/boot", "/dev", "/etc", "/lib", "/lib64", "/proc", "/root", "/sbin", "/sys", "/usr", "/var")
+_WIN_SYS_DIRS = (
+    os.environ.get("SystemDrive", "C:") + "\\",
+    os.environ.get("SystemRoot", r"C:\Windows"),
+    os.environ.get("ProgramFiles", r"C:\Program Files"),
+    os.environ.get("ProgramFiles(x86)", r"C:\Program Files (x86)"),
+    os.environ.get("ProgramData", r"C:\ProgramData"),
+)
+# Normalized once at import for the current platform, so each check is a single set lookup
+_SYSTEM_DIRS = frozenset(os.path.normcase(d) for d in (_WIN_SYS_DIRS if os.name == "nt" else _UNIX_SYS_DIRS))
+
+def is_system_directory(path: str, abs_path: str | None = None) -> bool:
+    """Checks whether path is one of the system directories the script must not run in.
+    path: The directory to check.
+    abs_path: The absolute form of path, if the caller has already computed it."""
+    if abs_path is None:
+        abs_path = os.path.abspath(path)
+    return os.path.normcase(abs_path) in _SYSTEM_DIRS
+
+def rename_directory(root_directory: str | os.PathLike[str], substrings_to_remove: list) -> None:
+    root_directory = os.fspath(root_directory)  # Everything below works on plain strings
+
+    # Check if the directory exists, with a single stat call
+    try:
+        st = os.stat(root_directory)
+    except (OSError, ValueError):
+        st = None
+    if st is None or not stat.S_ISDIR(st.st_mode):
         raise FileNotFoundError(f"The directory {root_directory} does not exist or is not a directory.")
 
     # Check if the directory is writable
@@ -12,9 +40,14 @@ def rename_directory(root_directory: str, substrings_to_remove: list) -> None:
         raise PermissionError(f"The directory {root_directory} is not writable.")
 
     # Warning about potential dangers of running the script in system directories
-    system_dirs = ["/", "/bin", "/boot", "/dev", "/etc", "/lib", "/lib64", "/proc", "/root", "/sbin", "/sys", "/usr", "/var"]
-    if os.path.abspath(root_directory) in system_dirs:
+    abs_path = os.path.abspath(root_directory)
+    if is_system_directory(root_directory, abs_path):
         raise ValueError("It is not safe to run this script in system directories.")
 
+    # Empty substrings would match every name, and a frozenset is what make_remover caches on
+    to_remove = frozenset(substring for substring in substrings_to_remove if substring)
+    if not to_remove:
+        return  # No name can change, so there is no need to walk the tree
+
     # Perform renaming of files and directories
-    rename_files_and_dirs(root_directory, set(substrings_to_remove))
+    _rename_with_remover(root_directory, make_remover(to_remove))
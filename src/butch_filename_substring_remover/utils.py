@@ -1,12 +1,54 @@
 
+import functools
+import sys
+from collections.abc import Callable
+
+# ANSI escapes only help on a terminal, so each output stream decides for itself
+_USE_COLOR = hasattr(sys.stdout, "isatty") and sys.stdout.isatty()
+_USE_COLOR_ERR = hasattr(sys.stderr, "isatty") and sys.stderr.isatty()
+
+@functools.lru_cache(maxsize=32)
+def make_remover(to_remove: frozenset[str]) -> Callable[[str], str]:
+    """Builds a function that removes the substrings in to_remove from a string, as remove_substrings does.
+    to_remove: A frozenset of substrings to remove from the strings passed to the returned function.
+    The substrings are lowercased once here, so the returned function can be reused for every name in a tree.
+    Results are cached, so repeated calls with the same substrings return the same function."""
+    lowered = tuple(substring.lower() for substring in to_remove)
+    # A name can only change if its lowercased first character starts one of the substrings;
+    # an empty substring matches every name, so it disables this check
+    first_chars = frozenset(substring[:1] for substring in lowered)
+    check_first_char = "" not in first_chars
+
+    def remove(s: str) -> str:
+        if check_first_char and s[:1].lower()[:1] not in first_chars:
+            return s
+        lower_s = s.lower()  # Computed once and reused by the loop below
+        # One C-level check against all substrings at once; most names that pass the first character still do not match
+        if not lower_s.startswith(lowered):
+            return s
+        for substring in lowered:
+            if lower_s.startswith(substring):
+                lower_s = lower_s[len(substring):]  # The match is at index 0, so slicing replaces a search-and-replace
+        return lower_s
+
+    return remove
+
 def remove_substrings(s: str, to_remove: set[str]) -> str:
     """Removes all substrings from the string s if they are present in the set to_remove.
     s: The string to remove substrings from.
     to_remove: A set of substrings to remove from the string s."""
-    for substring in to_remove:
-        if s.lower().startswith(substring.lower()):
-            s = s.lower().replace(substring.lower(), "", 1)
-    return s
+    return make_remover(frozenset(to_remove))(s)
+
+def is_valid_filename(name: str) -> bool:
+    """Checks whether name can be used as the new name of a file or folder.
+    name: The name to check.
+    Names that are empty or made only of dots and whitespace, such as "." and "..", are rejected."""
+    for ch in name:
+        if ch not in ". \t\r\n\v\f":
+            return True
+    return False
 
-def color_text(text, color_code):
-    return f"\033[{color_code}m{text}\033[0m"
\ No newline at end of file
+def color_text(text, color_code, to_stderr=False):
+    if not (_USE_COLOR_ERR if to_stderr else _USE_COLOR):
+        return f"{text}"
+    return f"\033[{color_code}m{text}\033[0m"